@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+"""
+Compares input_schema validation with the equivalent ModelForm on a payload
+of 1000 items. Run it from the repository root: python benchmarks/schema_validation.py
+"""
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests import setup_test_environment
+setup_test_environment()
+
+from restlayer import Response
+from restlayer.schema import Field
+from restlayer.tests import SimpleForm
+
+
+class SchemaResponse(Response):
+    input_schema = {
+        'foo': Field(),
+        'bar': Field(int),
+    }
+
+
+PAYLOAD = [{'foo': 'foo-{0}'.format(i), 'bar': str(i)} for i in range(1000)]
+
+
+def validate_forms():
+    for item in PAYLOAD:
+        form = SimpleForm(data=item)
+        assert form.is_valid()
+
+
+def validate_schema():
+    SchemaResponse().validate_input(PAYLOAD)
+
+
+def main():
+    number = 20
+    forms = min(timeit.repeat(validate_forms, number=number, repeat=3)) / number
+    schema = min(timeit.repeat(validate_schema, number=number, repeat=3)) / number
+
+    print('ModelForm:    {0:.2f} ms per 1000 items'.format(forms * 1000))
+    print('input_schema: {0:.2f} ms per 1000 items'.format(schema * 1000))
+    print('Speed-up:     {0:.1f}x'.format(forms / schema))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,9 @@ if LooseVersion(django.get_version()) < LooseVersion('1.5'):
     raise ImportError('Minimal Django version for django-restlayer is 1.5')
 
 from .api import (
-    HttpException, Http406, FormValidationError,
+    HttpException, Http406, FormValidationError, SchemaValidationError,
     Response, Resource
 )
-from .models import ModelResponse
+from .models import ModelResponse, batch_field, threaded_field
 
 from .version import __version__
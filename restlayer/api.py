@@ -5,22 +5,38 @@
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
 import json
+import logging
+import math
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 import sys
+import time
+import weakref
 
 import mimeparse
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.core.urlresolvers import reverse
+from django.core.files.uploadhandler import load_handler
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse, HttpResponseNotAllowed, Http404
 from django.utils.encoding import smart_text
-from django.utils.six import add_metaclass
+from django.utils.six import add_metaclass, string_types
 
-from restlayer.utils import get_request_data, xml_dumps, CONTENT_VERBS
+from restlayer.budget import BudgetExceeded, QueryCounter, check_budget, count_rows
+from restlayer.db import read_db, replica_routing_enabled
+from restlayer.schema import compile_schema
+from restlayer.throttling import ConcurrencyLimit
+from restlayer.utils import (
+    get_request_data, get_uri_template, xml_dumps, CONTENT_VERBS, SAFE_VERBS
+)
+
+
+logger = logging.getLogger('django.request')
 
 
 class FormError(dict):
@@ -42,11 +58,62 @@ class FormValidationError(HttpException):
         super(FormValidationError, self).__init__(FormError(form.errors), 400)
 
 
+class SchemaValidationError(HttpException):
+    def __init__(self, errors):
+        super(SchemaValidationError, self).__init__(FormError(errors), 400)
+
+
+# Every Response class still referenced somewhere (keys, values are unused)
+registry = weakref.WeakKeyDictionary()
+
+
+def build_plan(serializers, deserializers):
+    """
+    Builds the lookup tables used to negotiate and (de)serialize content.
+    """
+    return {
+        'mimes': [x[0] for x in serializers],
+        'serializers': dict(serializers),
+        'deserializers': dict(deserializers),
+        'accept': {},
+    }
+
+
+def negotiate(plan, accept):
+    """
+    Returns the best serializer mime type of a plan for an Accept header, or
+    None. Results are cached in the plan.
+    """
+    try:
+        return plan['accept'][accept]
+    except KeyError:
+        pass
+
+    try:
+        mime = mimeparse.best_match(plan['mimes'], accept) or None
+    except ValueError:
+        mime = None
+
+    if len(plan['accept']) < 100:
+        plan['accept'][accept] = mime
+    return mime
+
+
 class BaseResponse(type):
     def __new__(mcs, names, bases, attrs):
         new_class = super(BaseResponse, mcs).__new__(mcs, names, bases, attrs)
 
         new_class.methods = []
+        new_class._error_bodies = {}
+        new_class._plan = None
+
+        new_class.input_validator = None
+        if new_class.input_schema:
+            new_class.input_validator = staticmethod(compile_schema(new_class.input_schema))
+
+        new_class.concurrency = None
+        if new_class.max_concurrent:
+            new_class.concurrency = ConcurrencyLimit(new_class.max_concurrent)
 
         # Prepare HEAD response based on GET when possible.
         if not hasattr(new_class, 'response_head') and hasattr(new_class, 'response_get'):
@@ -56,6 +123,7 @@ class BaseResponse(type):
             if meth.startswith('response_') and callable(getattr(new_class, meth)):
                 new_class.methods.append(meth[9:])
 
+        registry[new_class] = True
         return new_class
 
 
@@ -73,12 +141,38 @@ class Response(HttpResponse):
         ('application/json', lambda req: json.loads(smart_text(req.body) or '{}')),
     )
 
+    # Dict of field names and restlayer.schema.Field instances (see validate_input)
+    input_schema = None
+
+    # Database alias used for safe methods (see restlayer.db.ReadReplicaRouter)
+    read_using = None
+    # Reads stay on the primary database for this many seconds after a write
+    read_sticky_delay = 5
+    read_sticky_cookie = 'restlayer_primary'
+
+    # Maximum request body size in bytes
+    max_upload_size = None
+    # Upload handlers (dotted paths) used instead of settings.FILE_UPLOAD_HANDLERS
+    upload_handlers = None
+
+    # Maximum number of queries and of returned rows (see restlayer.budget)
+    max_queries = None
+    max_rows = None
+
+    # A restlayer.throttling.Throttle instance, per client rate limit
+    throttle = None
+    # Maximum number of requests processed at the same time (per process)
+    max_concurrent = None
+
     def __init__(self, *args, **kwargs):
         super(Response, self).__init__(*args, **kwargs)
         self.mime = 'application/json'
         self.charset = 'UTF-8'
 
         self.data_loader = lambda x, req, **k: x
+        self._uri_base = None
+        self.rows = None
+        self._instance_plan = None
 
     def response_options(self, request, *args, **kwargs):
         self['Allow'] = ', '.join([x.upper() for x in self.methods])
@@ -89,27 +183,127 @@ class Response(HttpResponse):
         if not hasattr(self, 'response_get'):
             raise Http406
 
-        response = self.response_get(request, *args, **kwargs)
-        response.content = ''
-        return response
+        # make_response skips serialization for HEAD requests
+        return self.response_get(request, *args, **kwargs)
 
     def serialize(self, request, res, **options):
         # Get Python Data
         result = None
         if callable(self.data_loader):
             result = self.data_loader(res, request, **options)
+        self.rows = count_rows(result)
 
         # Formatting result
-        renderer = dict(self.serializers).get(self.mime)
+        renderer = self.get_response_plan()['serializers'].get(self.mime)
         if not renderer:
             raise Http406
 
         self['content-type'] = '{0}; charset={1}'.format(self.mime, self.charset)
         return renderer(result)
 
+    def serialize_error(self, request, error, cache=False):
+        """
+        Serializes an error message. With ``cache``, for fixed messages only,
+        bodies are kept per class and mime type so repeated errors skip the
+        serializer.
+        """
+        if not cache:
+            return self.serialize(request, error)
+
+        key = (self.mime, error)
+        content = self._error_bodies.get(key)
+        if content is None:
+            content = self._error_bodies[key] = self.serialize(request, error)
+        else:
+            self['content-type'] = '{0}; charset={1}'.format(self.mime, self.charset)
+        return content
+
+    def validate_input(self, data):
+        """
+        Validates data against ``input_schema`` and returns cleaned data. A
+        list of items is validated item by item. Raises SchemaValidationError.
+        """
+        if self.input_validator is None:
+            raise ImproperlyConfigured(
+                '{0} has no input_schema to validate data with.'.format(type(self).__name__))
+
+        if isinstance(data, (list, tuple)):
+            result = []
+            errors = {}
+            for i, item in enumerate(data):
+                cleaned, item_errors = self.input_validator(item)
+                if item_errors:
+                    errors[str(i)] = FormError(item_errors)
+                result.append(cleaned)
+        else:
+            result, errors = self.input_validator(data)
+
+        if errors:
+            raise SchemaValidationError(errors)
+        return result
+
+    @classmethod
+    def get_plan(cls):
+        """
+        Returns lookup tables built from the class configuration. They are
+        built on first use, or by ``warmup``.
+        """
+        if cls._plan is None:
+            cls._plan = build_plan(cls.serializers, cls.deserializers)
+        return cls._plan
+
+    def get_response_plan(self):
+        """
+        Returns the plan of this response: the class one, unless serializers
+        or deserializers were changed on the instance.
+        """
+        cls = type(self)
+        if self.serializers is cls.serializers and self.deserializers is cls.deserializers:
+            return cls.get_plan()
+
+        if self._instance_plan is None:
+            self._instance_plan = build_plan(self.serializers, self.deserializers)
+        return self._instance_plan
+
+    @classmethod
+    def check(cls):
+        """
+        Returns a list of configuration errors.
+        """
+        errors = []
+        for attr in ('serializers', 'deserializers'):
+            for item in getattr(cls, attr):
+                if len(item) != 2 or not callable(item[1]):
+                    errors.append('{0} item {1!r} is not a (mime, callable) pair.'.format(
+                        attr, item))
+                    continue
+                try:
+                    mimeparse.parse_mime_type(item[0])
+                except ValueError:
+                    errors.append('{0} mime type {1!r} is invalid.'.format(attr, item[0]))
+        return errors
+
+    @classmethod
+    def warmup(cls):
+        """
+        Builds the class plan and negotiates the most common Accept headers.
+        """
+        plan = cls.get_plan()
+        for accept in ['*/*'] + plan['mimes']:
+            cls.negotiate(accept)
+
+    @classmethod
+    def negotiate(cls, accept):
+        """
+        Returns the best serializer mime type for an Accept header, or None.
+        Results are cached per class.
+        """
+        return negotiate(cls.get_plan(), accept)
+
     def init_response(self, request):
+        plan = self.get_response_plan()
         accept = request.META.get('HTTP_ACCEPT', None)
-        if not accept and '*/*' in [x[0] for x in self.serializers]:
+        if not accept and '*/*' in plan['serializers']:
             accept = '*/*'
 
         # OPTIONS special case
@@ -122,18 +316,16 @@ class Response(HttpResponse):
             raise Http406
 
         # Prepare response now
-        try:
-            self.mime = mimeparse.best_match([x[0] for x in self.serializers], accept)
-            if not self.mime:
-                raise ValueError
-        except ValueError:
+        self.mime = negotiate(plan, accept)
+        if not self.mime:
             raise Http406
 
         # Reading data
         if request.method in CONTENT_VERBS:
+            self.init_upload(request)
             content_type = request.META.get('CONTENT_TYPE', '').split(';', 1)[0]
 
-            deserializers = dict(self.deserializers)
+            deserializers = plan['deserializers']
             deserializer = deserializers.get(content_type)
             # We may have a default deserializer
             if not deserializer:
@@ -146,10 +338,41 @@ class Response(HttpResponse):
             except BaseException as e:
                 raise HttpException(str(e), 400)
 
+    def init_upload(self, request):
+        if self.max_upload_size is not None:
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > self.max_upload_size:
+                raise HttpException('Request body too large', 413)
+
+        if self.upload_handlers is not None:
+            handlers = [load_handler(x, request) for x in self.upload_handlers]
+            try:
+                request.upload_handlers = handlers
+            except AttributeError:
+                # Django refuses new handlers once request.POST or
+                # request.FILES was read (by a middleware for instance), the
+                # data was parsed with the default ones.
+                pass
+
     def make_response(self, request, *args, **kwargs):
         if request.method.lower() not in self.methods:
             return HttpResponseNotAllowed([x.upper() for x in self.methods])
 
+        with read_db(self.get_read_db(request)):
+            if self.max_queries is None and self.max_rows is None:
+                response = self._make_response(request, *args, **kwargs)
+            else:
+                with QueryCounter() as counter:
+                    response = self._make_response(request, *args, **kwargs)
+                check_budget(type(self), request, counter.count, self.rows)
+
+        self.set_read_sticky(request, response)
+        return response
+
+    def _make_response(self, request, *args, **kwargs):
         meth = getattr(self, 'response_{0}'.format(request.method.lower()))
 
         try:
@@ -161,24 +384,84 @@ class Response(HttpResponse):
                 if request.method == 'HEAD':
                     res.content = ''
                 return res
-            self.content = self.serialize(request, res)
+            if request.method == 'HEAD':
+                self.prepare_head(request, res)
+            else:
+                self.content = self.serialize(request, res)
         except Http404:
             self.status_code = 404
-            self.content = self.serialize(request, "Resource not found")
+            self.content = self.serialize_error(request, "Resource not found", cache=True)
         except Http406 as e:
             self.status_code = e.args[1]
             self.content = ''
             self['content-type'] = 'text/plain'
         except HttpException as e:
             self.status_code = e.args[1]
-            self.content = self.serialize(request, e.args[0])
+            self.content = self.serialize_error(request, e.args[0])
         except BaseException as e:
             e.resp_obj = self
             raise
 
+        if request.method == 'HEAD':
+            self.content = ''
+
         self.set_common_headers(request)
         return self
 
+    def prepare_head(self, request, res):
+        """
+        Sets HEAD response headers without loading nor serializing data.
+        """
+        if self.mime not in self.get_response_plan()['serializers']:
+            raise Http406
+
+        self['content-type'] = '{0}; charset={1}'.format(self.mime, self.charset)
+        for k, v in self.get_head_headers(request, res).items():
+            self[k] = v
+
+    def get_head_headers(self, request, res):
+        """
+        Extra HEAD response headers, e.g. Content-Length or ETag of a cached
+        representation of ``res``.
+        """
+        return {}
+
+    def get_read_db(self, request):
+        """
+        Returns the database alias safe requests should read from, or None
+        to use the default one. Clients that wrote recently are kept on the
+        primary database so they can read their own writes.
+        """
+        if not self.read_using or request.method not in SAFE_VERBS:
+            return None
+
+        try:
+            sticky_until = float(request.COOKIES.get(self.read_sticky_cookie, 0))
+        except ValueError:
+            sticky_until = 0
+
+        if sticky_until > time.time():
+            return None
+        return self.read_using
+
+    def set_read_sticky(self, request, response):
+        """
+        Pins the client to the primary database after a successful write, on
+        any response class as soon as ReadReplicaRouter is in use.
+        """
+        if not self.read_sticky_delay:
+            return
+        if request.method in SAFE_VERBS or response.status_code >= 400:
+            return
+        if not self.read_using and not replica_routing_enabled():
+            return
+
+        response.set_cookie(
+            self.read_sticky_cookie,
+            str(time.time() + self.read_sticky_delay),
+            max_age=self.read_sticky_delay
+        )
+
     def get_common_headers(self, request):
         return {}
 
@@ -187,9 +470,10 @@ class Response(HttpResponse):
             if k not in self:
                 self[k] = v
 
-    def paginate(self, request, object_list, limit=50):
+    def paginate(self, request, object_list, limit=50, params=None):
         """
-        Pagination helper
+        Pagination helper. ``params`` are added to the query string of the
+        next and previous page URIs.
         """
         paginator = Paginator(object_list, limit)
         try:
@@ -206,6 +490,7 @@ class Response(HttpResponse):
         self['X-Pages-Current'] = page.number
 
         GET = request.GET.copy()
+        GET.update(params or {})
         if page.has_next():
             GET['page'] = page.number + 1
             self['X-Pages-Next'] = page.number + 1
@@ -229,51 +514,141 @@ class Response(HttpResponse):
     def reverse(self, request, view, args=None, kwargs=None):
         return self._build_absolute_uri(request, reverse(view, args=args, kwargs=kwargs))
 
+    def uri_template(self, request, view):
+        """
+        Returns a callable building absolute URIs of ``view`` from its
+        arguments. Much faster than ``reverse`` when called for each row.
+        """
+        template = get_uri_template(view)
+
+        build = type(self)._build_absolute_uri
+        if getattr(build, '__func__', build) is not _default_build_absolute_uri:
+            # An overridden _build_absolute_uri may depend on the location
+            return lambda *args, **kwargs: self._build_absolute_uri(
+                request, template(*args, **kwargs))
+
+        if self._uri_base is None:
+            self._uri_base = self._build_absolute_uri(request, '/')[:-1]
+        return lambda *args, **kwargs: self._uri_base + template(*args, **kwargs)
+
+
+_default_build_absolute_uri = getattr(
+    Response._build_absolute_uri, '__func__', Response._build_absolute_uri)
+
 
 class Resource(object):
     csrf_exempt = True
 
+    error_content = 'An error occured.'
+    # Serialize 500 bodies like other errors instead of sending plain text
+    structured_errors = False
+    # Identical errors are logged at most once per interval (in seconds)
+    error_log_interval = 10
+
     def __init__(self, resp_class):
         self.resp_class = resp_class
 
     def __call__(self, request, *args, **kwargs):
+        throttle = self.resp_class.throttle
+        if throttle is not None:
+            wait = throttle.consume(self.get_throttle_key(request))
+            if wait:
+                return self.throttled(request, wait)
+
+        concurrency = self.resp_class.concurrency
+        if concurrency is not None and not concurrency.acquire():
+            return self.throttled(request, 1)
+
         try:
             return self.resp_class().make_response(request, *args, **kwargs)
+        except BudgetExceeded:
+            # Only raised in strict mode, mostly in tests
+            raise
         except BaseException as e:
             return self.handle_exception(e, request)
+        finally:
+            if concurrency is not None:
+                concurrency.release()
+
+    def get_throttle_key(self, request):
+        return 'restlayer:throttle:{0}.{1}:{2}'.format(
+            self.resp_class.__module__, self.resp_class.__name__,
+            self.resp_class.throttle.get_client_key(request)
+        )
 
-    def handle_exception(self, exc, request):
-        from django.utils.log import getLogger
-        from django.conf import settings
+    def throttled(self, request, wait):
+        resp = HttpResponse('Too many requests.', status=429, content_type='text/plain')
+        resp['Retry-After'] = int(math.ceil(wait))
+        return resp
 
-        logger = getLogger('django.request')
+    def handle_exception(self, exc, request):
         exc_info = sys.exc_info()
 
-        logger.error(
-            'Internal Server Error: %s', request.path,
-            exc_info=exc_info,
-            extra={
-                'status_code': 500,
-                'request': request
-            }
-        )
-
-        resp = HttpResponse('', status=500, content_type='text/plain')
-        resp.content = ''
+        log, suppressed = _sample_error(exc_info, self.error_log_interval)
+        if log:
+            message = 'Internal Server Error: %s'
+            if suppressed:
+                message += ' ({0} similar errors not logged)'.format(suppressed)
+            logger.error(
+                message, request.path,
+                exc_info=exc_info,
+                extra={
+                    'status_code': 500,
+                    'request': request
+                }
+            )
 
         if hasattr(exc, 'resp_obj'):
             resp = exc.resp_obj
             resp.status_code = 500
             resp.set_common_headers(request)
         else:
-            resp = HttpResponse('', status=500, content_type='text/plain')
-
-        resp.content = 'An error occured.'
+            resp = HttpResponse(status=500)
 
         if settings.DEBUG:
             from django.views.debug import ExceptionReporter
             reporter = ExceptionReporter(request, *exc_info)
             resp.content = reporter.get_traceback_text()
+        elif self.structured_errors and hasattr(exc, 'resp_obj'):
+            try:
+                resp.content = resp.serialize_error(
+                    request, {'status': 500, 'message': self.error_content})
+                return resp
+            except BaseException:
+                resp.content = self.error_content
+        else:
+            resp.content = self.error_content
 
         resp['Content-Type'] = 'text/plain'
         return resp
+
+
+_logged_errors = {}
+
+
+def _sample_error(exc_info, interval):
+    """
+    Tells whether an error should be logged. Identical tracebacks are logged
+    at most once every ``interval`` seconds. Returns a tuple of the decision
+    and the number of errors skipped since the last logged one.
+    """
+    if not interval:
+        return True, 0
+
+    frames = []
+    tb = exc_info[2]
+    while tb is not None:
+        frames.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+        tb = tb.tb_next
+    key = (exc_info[0], tuple(frames))
+
+    now = time.time()
+    last, suppressed = _logged_errors.get(key, (0, 0))
+    if now - last < interval:
+        _logged_errors[key] = (last, suppressed + 1)
+        return False, suppressed
+
+    if len(_logged_errors) >= 1000 and key not in _logged_errors:
+        _logged_errors.clear()
+    _logged_errors[key] = (now, 0)
+    return True, suppressed
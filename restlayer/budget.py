@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.util import CursorWrapper
+from django.dispatch import Signal
+
+
+logger = logging.getLogger('restlayer.budget')
+
+# Sent when a response exceeds its budget (outside strict mode), with
+# request, queries and rows arguments. Connect it to your metrics.
+budget_exceeded = Signal(providing_args=['request', 'queries', 'rows'])
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class CountingCursor(object):
+    """
+    Cursor wrapper counting executed statements, nothing else.
+    """
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+
+class QueryCounter(object):
+    """
+    Counts queries run on the current thread connections (all of them, or
+    the ``using`` one) while the block runs.
+
+    Cursors are wrapped by replacing the connection ``make_debug_cursor``, so
+    queries are neither logged nor recorded unless they already were.
+    """
+    def __init__(self, using=None):
+        self.using = using
+        self.count = 0
+
+    def __enter__(self):
+        if self.using is None:
+            self.connections = list(connections.all())
+        else:
+            self.connections = [connections[self.using]]
+
+        self.states = []
+        for connection in self.connections:
+            self.states.append((
+                connection.use_debug_cursor,
+                connection.__dict__.get('make_debug_cursor')
+            ))
+            connection.make_debug_cursor = self.get_cursor_factory(connection)
+            connection.use_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection, (use_debug_cursor, make_debug_cursor) in zip(
+                self.connections, self.states):
+            connection.use_debug_cursor = use_debug_cursor
+            if make_debug_cursor is None:
+                del connection.make_debug_cursor
+            else:
+                connection.make_debug_cursor = make_debug_cursor
+
+    def get_cursor_factory(self, connection):
+        debug = (connection.use_debug_cursor or
+                 (connection.use_debug_cursor is None and settings.DEBUG))
+        make_debug_cursor = connection.make_debug_cursor
+
+        def factory(cursor):
+            if debug:
+                cursor = make_debug_cursor(cursor)
+            else:
+                cursor = CursorWrapper(cursor, connection)
+            return CountingCursor(cursor, self)
+
+        return factory
+
+
+def count_rows(data):
+    """
+    Returns the length of the largest list in loaded data (lists nested in
+    dicts included), or None when there is no list.
+    """
+    if isinstance(data, (list, tuple)):
+        return len(data)
+
+    if isinstance(data, dict):
+        counts = [x for x in (count_rows(v) for v in data.values()) if x is not None]
+        if counts:
+            return max(counts)
+
+    return None
+
+
+def check_budget(resp_class, request, queries, rows):
+    """
+    Compares query and row counts of a response with its class budget. Raises
+    BudgetExceeded when the RESTLAYER_BUDGET_STRICT setting is true, logs a
+    warning and sends ``budget_exceeded`` otherwise.
+    """
+    errors = []
+    if resp_class.max_queries is not None and queries > resp_class.max_queries:
+        errors.append('{0} queries (max {1})'.format(queries, resp_class.max_queries))
+    if resp_class.max_rows is not None and rows is not None and rows > resp_class.max_rows:
+        errors.append('{0} rows (max {1})'.format(rows, resp_class.max_rows))
+
+    if not errors:
+        return
+
+    message = '{0}.{1} exceeded its budget on {2}: {3}'.format(
+        resp_class.__module__, resp_class.__name__, request.path, ', '.join(errors))
+
+    if getattr(settings, 'RESTLAYER_BUDGET_STRICT', False):
+        raise BudgetExceeded(message)
+
+    logger.warning(message, extra={'request': request})
+    budget_exceeded.send(sender=resp_class, request=request, queries=queries, rows=rows)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from contextlib import contextmanager
+import threading
+
+from django.conf import settings
+
+
+_state = threading.local()
+
+
+def get_read_db():
+    """
+    Returns the database alias reads should go to for the response being
+    processed in the current thread, or None.
+    """
+    return getattr(_state, 'read_db', None)
+
+
+@contextmanager
+def read_db(alias):
+    """
+    Routes reads to ``alias`` while the block runs. A None alias leaves
+    routing to the other routers (usually the default database).
+    """
+    previous = get_read_db()
+    _state.read_db = alias
+    try:
+        yield
+    finally:
+        _state.read_db = previous
+
+
+def replica_routing_enabled():
+    """
+    Tells whether ReadReplicaRouter is part of the DATABASE_ROUTERS setting.
+    """
+    for router in getattr(settings, 'DATABASE_ROUTERS', ()):
+        if router == 'restlayer.db.ReadReplicaRouter' or isinstance(router, ReadReplicaRouter):
+            return True
+    return False
+
+
+class ReadReplicaRouter(object):
+    """
+    Database router sending reads to the alias chosen by the current response
+    (see ``Response.read_using``). Add it to ``DATABASE_ROUTERS``.
+    """
+    def db_for_read(self, model, **hints):
+        return get_read_db()
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from restlayer.api import registry
+from restlayer.warmup import warmup
+
+
+class Command(NoArgsCommand):
+    help = ('Checks the configuration of every restlayer Response class. It runs in its own '
+            'process, call restlayer.warmup.warmup() from your WSGI script to prepare workers.')
+
+    def handle_noargs(self, **options):
+        errors, duration = warmup()
+
+        for resp_class, class_errors in errors.items():
+            for error in class_errors:
+                self.stderr.write('{0}.{1}: {2}'.format(
+                    resp_class.__module__, resp_class.__name__, error))
+
+        if errors:
+            raise CommandError('{0} response classes are misconfigured.'.format(len(errors)))
+
+        self.stdout.write('{0} response classes checked, no errors found.'.format(len(registry)))
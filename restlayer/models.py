@@ -4,9 +4,86 @@
 # See the LICENSE for more information.
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
+from multiprocessing.pool import ThreadPool
+import threading
+import weakref
+
 from django import db
+from django.core.urlresolvers import get_script_prefix, get_urlconf, set_script_prefix, set_urlconf
+from django.utils import translation
+from django.utils.six import string_types
+
+from restlayer.api import HttpException, Response
+from restlayer.db import get_read_db, read_db
+
+
+def batch_field(func):
+    """
+    Marks a response method as a batch field. It's called once per list of
+    instances, as ``func(instances, request)``, and returns a list of values
+    in the same order.
+    """
+    func.batch_field = True
+    return func
+
+
+def threaded_field(func):
+    """
+    Marks a response method as a threaded field. It's called for each
+    instance as usual but instances are processed concurrently in a thread
+    pool. Use it for I/O bound fields only, not for database queries.
+
+    The active language, URLconf, script prefix and read database of the
+    request are set in the worker threads, so ``reverse`` and
+    ``uri_template`` work as in the request thread. Other thread-local state
+    is not carried.
+    """
+    func.threaded_field = True
+    return func
+
+
+_field_pools = weakref.WeakKeyDictionary()
+_field_pools_lock = threading.Lock()
+
 
-from restlayer.api import Response
+def get_field_pool(resp_class):
+    """
+    Returns the thread pool of a response class, created on first use with
+    ``field_workers`` threads and kept as long as the class exists.
+    """
+    pool = _field_pools.get(resp_class)
+    if pool is None:
+        with _field_pools_lock:
+            pool = _field_pools.get(resp_class)
+            if pool is None:
+                pool = _field_pools[resp_class] = ThreadPool(resp_class.field_workers)
+                # Stop the threads once the class is gone
+                pool.class_ref = weakref.ref(resp_class, lambda ref: pool.close())
+    return pool
+
+
+def with_request_state(func):
+    """
+    Wraps ``func`` to run it with the thread-local request state of the
+    calling thread.
+    """
+    language = translation.get_language()
+    urlconf = get_urlconf()
+    script_prefix = get_script_prefix()
+    alias = get_read_db()
+
+    def wrapper(*args):
+        translation.activate(language)
+        set_urlconf(urlconf)
+        set_script_prefix(script_prefix)
+        try:
+            with read_db(alias):
+                return func(*args)
+        finally:
+            translation.deactivate()
+            set_urlconf(None)
+
+    return wrapper
 
 
 class ModelDataLoader(object):
@@ -15,6 +92,8 @@ class ModelDataLoader(object):
 
     def __call__(self, res, request, **options):
         if isinstance(res, db.models.query.QuerySet):
+            res = list(res)
+            options['page_values'] = self.get_page_values(res, request, **options)
             return [self(x, request, **options) for x in res]
 
         elif isinstance(res, db.models.Model):
@@ -23,12 +102,45 @@ class ModelDataLoader(object):
                 for x in options.get('fields', ('pk',))
             ])
 
+        elif isinstance(res, dict):
+            return dict([(k, self(v, request, **options)) for k, v in res.items()])
+
         return res
 
+    def get_page_values(self, instances, request, **options):
+        """
+        Computes batch and threaded fields for a list of instances. Returns a
+        dict of field names and dicts of instance ids and values.
+        """
+        resp = options.get('resp')
+        if not resp or not instances:
+            return {}
+
+        values = {}
+        for field in options.get('fields', ('pk',)):
+            f = getattr(resp, field, None)
+            if getattr(f, 'batch_field', False):
+                result = f(instances, request)
+            elif getattr(f, 'threaded_field', False):
+                result = get_field_pool(type(resp)).map(
+                    with_request_state(lambda x: f(x, request)), instances)
+            else:
+                continue
+
+            values[field] = dict(zip([id(x) for x in instances], result))
+
+        return values
+
     def get_field_value(self, instance, field, request, **options):
         resp = options.get('resp')
         if resp:
+            page_values = options.get('page_values')
+            if page_values and field in page_values:
+                return page_values[field][id(instance)]
+
             f = getattr(resp, field, None)
+            if getattr(f, 'batch_field', False):
+                return f([instance], request)[0]
             if callable(f):
                 return f(instance, request)
 
@@ -44,11 +156,35 @@ class ModelDataLoader(object):
 
 class ModelResponse(Response):
     fields = ('id',)
+    # Optional model class, only used to check fields
+    model = None
+    # Changes recorded during the last sync_lag seconds are left for the next
+    # sync (see restlayer.sync.current_token)
+    sync_lag = 0
+    # Size of the class thread pool used to compute threaded fields
+    field_workers = 4
 
     def __init__(self, *args, **kwargs):
         super(ModelResponse, self).__init__(*args, **kwargs)
         self.data_loader = ModelDataLoader(self.fields)
 
+    @classmethod
+    def check(cls):
+        errors = super(ModelResponse, cls).check()
+
+        if cls.model is not None:
+            model_fields = cls.model._meta.get_all_field_names()
+
+        for field in cls.fields:
+            if not isinstance(field, string_types):
+                errors.append('Field {0!r} is not a string.'.format(field))
+            elif cls.model is not None and not (
+                hasattr(cls, field) or field in model_fields or hasattr(cls.model, field)
+            ):
+                errors.append('Field {0} not found.'.format(field))
+
+        return errors
+
     def serialize(self, request, res, **options):
         return super(ModelResponse, self).serialize(
             request, res,
@@ -59,3 +195,76 @@ class ModelResponse(Response):
         if callable(self.data_loader):
             fields = options.pop('fields', self.fields)
             return self.data_loader(res, request, fields=fields, resp=self, **options)
+
+    def sync(self, request, queryset, limit=None, report_excluded=False):
+        """
+        Delta sync helper. Without a sync token (``X-Sync-Token`` header or
+        ``since`` parameter), returns every object of ``queryset``. With one,
+        returns objects created or updated since then and primary keys of the
+        deleted ones. The next token is sent in the ``X-Sync-Token`` header.
+        The model must be tracked with ``restlayer.sync.track``.
+
+        Deleted keys come from the change log of the whole model, ``queryset``
+        filters don't apply to them. With ``report_excluded``, updated objects
+        not matching ``queryset`` are reported as deleted too, whether they
+        matched it before or never did: only use it when clients may know
+        every primary key.
+
+        With ``limit``, objects are split in pages (see ``paginate``). Deleted
+        keys are on the first page and every page sends the token of the
+        first one, carried by the ``until`` parameter of page URIs.
+
+        Tokens older than the pruned part of the change log get a 410
+        response, the client must then sync again without token.
+        """
+        from restlayer.sync import changes_since, current_token, is_expired
+
+        token = request.META.get('HTTP_X_SYNC_TOKEN') or request.GET.get('since')
+        try:
+            until = int(request.GET.get('until') or current_token(self.sync_lag))
+        except ValueError:
+            raise HttpException('Invalid sync token', 400)
+        deleted = []
+
+        if token:
+            try:
+                token = int(token)
+            except ValueError:
+                raise HttpException('Invalid sync token', 400)
+
+            if is_expired(token):
+                raise HttpException('Expired sync token', 410)
+
+            updated, deleted = changes_since(queryset.model, token, until)
+            if limit:
+                # Pages of the changed keys, a list that doesn't move
+                updated = self.paginate(request, sorted(updated), limit, {'until': until})
+                if self['X-Pages-Current'] != '1':
+                    deleted = []
+            queryset = queryset.filter(pk__in=updated)
+
+            if report_excluded:
+                found = set(queryset.values_list('pk', flat=True))
+                deleted.extend(x for x in updated if x not in found)
+
+        elif limit:
+            if not queryset.ordered:
+                queryset = queryset.order_by('pk')
+            queryset = self.paginate(request, queryset, limit, {'until': until})
+
+        self['X-Sync-Token'] = until
+        return {'objects': queryset, 'deleted': deleted}
+
+
+class ChangeLog(db.models.Model):
+    """
+    Changes of the models tracked by restlayer.sync, used for delta sync.
+    """
+    model = db.models.CharField(max_length=100)
+    object_pk = db.models.CharField(max_length=255)
+    deleted = db.models.BooleanField(default=False)
+    created = db.models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        app_label = 'restlayer'
+        index_together = (('model', 'id'),)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_text
+from django.utils.six import integer_types, text_type
+
+
+NON_FIELD_ERRORS = '__all__'
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = force_text(value).lower()
+    if value in ('1', 'true', 'on', 'yes'):
+        return True
+    if value in ('0', 'false', 'off', 'no'):
+        return False
+    raise ValueError
+
+
+def to_int(value):
+    # Like Django IntegerField: no booleans, no truncated floats
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError
+        return int(value)
+    if isinstance(value, integer_types):
+        return value
+    return int(force_text(value).strip())
+
+
+def to_float(value):
+    if isinstance(value, bool):
+        raise ValueError
+    value = float(value)
+    if value != value or value in (float('inf'), float('-inf')):
+        raise ValueError
+    return value
+
+
+def to_text(value):
+    if isinstance(value, (list, dict)):
+        raise ValueError
+    return force_text(value)
+
+
+COERCERS = {
+    text_type: to_text,
+    str: to_text,
+    int: to_int,
+    float: to_float,
+    bool: to_bool,
+}
+
+MESSAGES = {
+    int: 'Enter a whole number.',
+    float: 'Enter a number.',
+    bool: 'Enter a boolean value.',
+}
+
+
+class Field(object):
+    """
+    Input field description. ``type`` is a callable converting a raw value
+    (``int``, ``float``, ``bool``, ``text_type`` or any other callable raising
+    ValueError or TypeError).
+    """
+    def __init__(self, type=text_type, required=True, default=None,
+                 min_length=None, max_length=None, choices=None):
+        if (min_length is not None or max_length is not None) and type in MESSAGES:
+            raise ImproperlyConfigured('min_length and max_length only apply to text fields.')
+
+        self.type = type
+        self.required = required
+        self.default = default
+        self.min_length = min_length
+        self.max_length = max_length
+        self.choices = choices
+
+    def compile(self):
+        """
+        Returns a function cleaning a raw value or raising ValueError with the
+        error message. Only needed checks are part of the function.
+        """
+        coerce = COERCERS.get(self.type, self.type)
+        invalid = MESSAGES.get(self.type, 'Enter a valid value.')
+        required = self.required
+        default = self.default
+        checks = []
+
+        if self.min_length is not None:
+            min_length = self.min_length
+
+            def check_min_length(value):
+                if len(value) < min_length:
+                    raise ValueError(
+                        'Ensure this value has at least {0} characters (it has {1}).'.format(
+                            min_length, len(value)))
+            checks.append(check_min_length)
+
+        if self.max_length is not None:
+            max_length = self.max_length
+
+            def check_max_length(value):
+                if len(value) > max_length:
+                    raise ValueError(
+                        'Ensure this value has at most {0} characters (it has {1}).'.format(
+                            max_length, len(value)))
+            checks.append(check_max_length)
+
+        if self.choices is not None:
+            choices = frozenset(x[0] if isinstance(x, (list, tuple)) else x for x in self.choices)
+
+            def check_choices(value):
+                if value not in choices:
+                    raise ValueError(
+                        'Select a valid choice. {0} is not one of the available choices.'.format(
+                            value))
+            checks.append(check_choices)
+
+        def clean(value):
+            if value is None or value == '':
+                if required:
+                    raise ValueError('This field is required.')
+                return default
+
+            try:
+                value = coerce(value)
+            except (TypeError, ValueError):
+                raise ValueError(invalid)
+
+            for check in checks:
+                check(value)
+            return value
+
+        return clean
+
+
+def compile_schema(schema):
+    """
+    Compiles a dict of field names and Field instances into a validator. The
+    validator takes a mapping (a dict or a QueryDict) and returns a tuple of
+    cleaned data and errors, a dict of field names and lists of messages.
+    """
+    cleaners = [(name, field.compile()) for name, field in sorted(schema.items())]
+
+    def validate(data):
+        if not hasattr(data, 'get'):
+            return {}, {NON_FIELD_ERRORS: ['Invalid data.']}
+
+        cleaned = {}
+        errors = {}
+        get = data.get
+        for name, clean in cleaners:
+            try:
+                cleaned[name] = clean(get(name))
+            except ValueError as e:
+                errors[name] = [force_text(e)]
+        return cleaned, errors
+
+    return validate
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from datetime import timedelta
+
+from django.db.models import Max, Min
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from restlayer.models import ChangeLog
+
+
+def get_label(model):
+    return '{0}.{1}'.format(model._meta.app_label, model._meta.object_name.lower())
+
+
+def track(model):
+    """
+    Records saves and deletions of ``model`` instances in the change log.
+    """
+    label = get_label(model)
+
+    def on_save(sender, instance, **kwargs):
+        ChangeLog.objects.create(model=label, object_pk=force_text(instance.pk))
+
+    def on_delete(sender, instance, **kwargs):
+        ChangeLog.objects.create(model=label, object_pk=force_text(instance.pk), deleted=True)
+
+    post_save.connect(on_save, sender=model, weak=False,
+                      dispatch_uid='restlayer_sync_save_{0}'.format(label))
+    post_delete.connect(on_delete, sender=model, weak=False,
+                        dispatch_uid='restlayer_sync_delete_{0}'.format(label))
+
+
+def current_token(lag=0):
+    """
+    Returns the latest change id, ignoring changes recorded during the last
+    ``lag`` seconds.
+
+    Ids are given in insertion order, not commit order: a change committed
+    after a later one was read by a client is never sent to this client.
+    A lag longer than your write transactions avoids it.
+    """
+    changes = ChangeLog.objects.all()
+    if lag:
+        changes = changes.filter(created__lte=timezone.now() - timedelta(seconds=lag))
+    return changes.aggregate(Max('pk'))['pk__max'] or 0
+
+
+def is_expired(token):
+    """
+    Tells whether changes following ``token`` were pruned.
+    """
+    oldest = ChangeLog.objects.aggregate(Min('pk'))['pk__min']
+    return oldest is not None and token < oldest - 1
+
+
+def prune(before):
+    """
+    Deletes changes recorded before ``before`` (a datetime). The latest change
+    is always kept, clients with older tokens will get a 410 response.
+    """
+    ChangeLog.objects.filter(created__lt=before).exclude(pk=current_token()).delete()
+
+
+def changes_since(model, token, until):
+    """
+    Returns a tuple of primary keys of ``model`` instances updated and deleted
+    after ``token``, up to ``until`` (included).
+    """
+    changes = ChangeLog.objects.filter(
+        model=get_label(model), pk__gt=token, pk__lte=until
+    ).order_by('pk').values_list('object_pk', 'deleted')
+
+    # Last change of each object wins
+    state = dict(changes)
+    to_python = model._meta.pk.to_python
+    updated = [to_python(k) for k, deleted in state.items() if not deleted]
+    deleted = [to_python(k) for k, deleted in state.items() if deleted]
+    return updated, deleted
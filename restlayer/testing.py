@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+from restlayer.budget import QueryCounter
+
+
+class ResourceTestMixin(object):
+    """
+    Assertions for django.test.TestCase classes testing resources.
+    """
+    def assertResourceQueries(self, num, path, method='get', **extra):
+        """
+        Requests ``path`` with the test client and checks the number of
+        queries it took. Call it with different amounts of data to pin a
+        query count that doesn't depend on the page size.
+        """
+        with QueryCounter() as counter:
+            response = getattr(self.client, method)(path, **extra)
+
+        self.assertEqual(
+            counter.count, num,
+            '{0} {1} ran {2} queries, {3} expected.'.format(
+                method.upper(), path, counter.count, num)
+        )
+        return response
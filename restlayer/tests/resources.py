@@ -5,8 +5,14 @@
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
 from django.shortcuts import get_object_or_404
+from django.utils import translation
 
-from restlayer import Resource, Response, ModelResponse, FormValidationError
+from restlayer import (
+    Resource, Response, ModelResponse, FormValidationError, batch_field, threaded_field
+)
+from restlayer.schema import Field
+from restlayer.sync import track
+from restlayer.throttling import Throttle
 
 from restlayer.tests import SimpleModel, SimpleForm
 
@@ -15,6 +21,9 @@ class SimpleResponse(Response):
     def response_get(self, request):
         return ['foo', 'bar']
 
+    def get_head_headers(self, request, res):
+        return {'ETag': '"{0}"'.format(len(res))}
+
 
 class SimplePost(Response):
     def response_post(self, request):
@@ -35,11 +44,40 @@ class SimpleEcho(Response):
     response_patch = echo
 
 
+class SimpleUpload(Response):
+    max_upload_size = 1024
+    upload_handlers = ('django.core.files.uploadhandler.TemporaryFileUploadHandler',)
+
+    def response_put(self, request):
+        return {
+            'foo': request.data.get('foo'),
+            'files': dict((k, f.read().decode('utf-8')) for k, f in request.data_files.items()),
+            'method': request.method
+        }
+
+    response_post = response_put
+
+
+class SimpleSchema(Response):
+    input_schema = {
+        'foo': Field(max_length=10),
+        'bar': Field(int),
+        'kind': Field(required=False, default='a', choices=('a', 'b')),
+    }
+
+    def response_post(self, request):
+        return self.validate_input(request.data)
+
+
 class SimpleError(Response):
     def response_get(self, request):
         raise Exception('Woops')
 
 
+class StructuredResource(Resource):
+    structured_errors = True
+
+
 class SimpleSerializerText(Response):
     serializers = (
         ('text/plain', lambda x: x),
@@ -58,11 +96,39 @@ class SimpleSerializerAny(Response):
         return 'any'
 
 
+class SimpleSerializerInstance(Response):
+    def __init__(self, *args, **kwargs):
+        super(SimpleSerializerInstance, self).__init__(*args, **kwargs)
+        self.serializers = (
+            ('text/plain', lambda x: x),
+        )
+
+    def response_get(self, request):
+        return 'instance'
+
+
+class SimpleThrottled(Response):
+    throttle = Throttle(2, per=60)
+
+    def response_get(self, request):
+        return 'ok'
+
+
+class SimpleLimited(Response):
+    max_concurrent = 1
+
+    def response_get(self, request):
+        # Nested call while this request is still in flight
+        return simple_limited(request).status_code
+
+
 class SimpleObjectList(ModelResponse):
+    model = SimpleModel
     fields = ('id', 'foo', 'bar', 'resource_uri')
+    max_queries = 2
 
     def resource_uri(self, instance, request):
-        return self.reverse(request, 'simple_object', args=(instance.pk,))
+        return self.uri_template(request, 'simple_object')(instance.pk)
 
     def response_get(self, request):
         return self.paginate(request, SimpleModel.objects.all(), 10)
@@ -78,6 +144,69 @@ class SimpleObjectList(ModelResponse):
         return instance.pk
 
 
+class SimpleObjectBatch(ModelResponse):
+    fields = ('id', 'double_bar', 'upper_foo', 'language')
+    batch_calls = []
+
+    @batch_field
+    def double_bar(self, instances, request):
+        self.batch_calls.append(len(instances))
+        return [x.bar * 2 for x in instances]
+
+    @threaded_field
+    def upper_foo(self, instance, request):
+        return instance.foo.upper()
+
+    @threaded_field
+    def language(self, instance, request):
+        return translation.get_language()
+
+    def response_get(self, request, pk=None):
+        translation.activate(request.GET.get('lang', 'en'))
+        if pk is not None:
+            return get_object_or_404(SimpleModel, pk=pk)
+        return self.paginate(request, SimpleModel.objects.order_by('pk'), 10)
+
+
+class SimpleObjectGreedy(ModelResponse):
+    fields = ('id', 'same_bar')
+    max_queries = 2
+    max_rows = 5
+
+    def same_bar(self, instance, request):
+        return SimpleModel.objects.filter(bar=instance.bar).count()
+
+    def response_get(self, request):
+        return self.paginate(request, SimpleModel.objects.all(), 10)
+
+
+track(SimpleModel)
+
+
+class SimpleObjectSync(ModelResponse):
+    fields = ('id', 'foo', 'bar')
+
+    def response_get(self, request):
+        queryset = SimpleModel.objects.all()
+        if 'bar_lt' in request.GET:
+            queryset = queryset.filter(bar__lt=request.GET['bar_lt'])
+        return self.sync(request, queryset, limit=2 if 'paged' in request.GET else None,
+                         report_excluded='public' in request.GET)
+
+
+class SimpleObjectReplica(ModelResponse):
+    read_using = 'replica'
+    fields = ('id', 'foo')
+
+    def response_get(self, request):
+        return self.paginate(request, SimpleModel.objects.all(), 10)
+
+    def response_post(self, request):
+        instance = SimpleModel.objects.create(foo=request.data['foo'], bar=0)
+        self.status_code = 201
+        return instance.pk
+
+
 class SimpleObject(ModelResponse):
     fields = ('id', 'foo', 'bar', 'resource_uri')
 
@@ -110,9 +239,19 @@ class SimpleObject(ModelResponse):
 simple = Resource(SimpleResponse)
 simple_post = Resource(SimplePost)
 simple_echo = Resource(SimpleEcho)
+simple_upload = Resource(SimpleUpload)
+simple_schema = Resource(SimpleSchema)
 simple_error = Resource(SimpleError)
+simple_error_structured = StructuredResource(SimpleError)
 simple_s_text = Resource(SimpleSerializerText)
 simple_s_any = Resource(SimpleSerializerAny)
+simple_s_instance = Resource(SimpleSerializerInstance)
+simple_throttled = Resource(SimpleThrottled)
+simple_limited = Resource(SimpleLimited)
 
 simple_object_list = Resource(SimpleObjectList)
 simple_object = Resource(SimpleObject)
+simple_object_batch = Resource(SimpleObjectBatch)
+simple_object_greedy = Resource(SimpleObjectGreedy)
+simple_object_sync = Resource(SimpleObjectSync)
+simple_object_replica = Resource(SimpleObjectReplica)
@@ -4,14 +4,41 @@
 # See the LICENSE for more information.
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
+from datetime import timedelta
+import gc
 import json
+import logging
+from multiprocessing.pool import RUN
 import pickle
 
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.urlresolvers import NoReverseMatch
 from django.test import Client, TestCase
-from django.test.client import FakePayload
+from django.test.client import (
+    BOUNDARY, MULTIPART_CONTENT, FakePayload, RequestFactory, encode_multipart
+)
+from django.utils import timezone, translation
 from django.utils.encoding import smart_text
+from django.utils.six import StringIO
 from django.utils.six.moves.urllib.parse import urlparse
 
+from restlayer import api, ModelResponse, Response
+from restlayer.api import registry
+from restlayer.budget import BudgetExceeded, QueryCounter, budget_exceeded, count_rows
+from restlayer.models import _field_pools, get_field_pool
+from restlayer.schema import Field, compile_schema
+from restlayer.sync import prune
+from restlayer.testing import ResourceTestMixin
+from restlayer.tests import SimpleModel
+from restlayer.tests.resources import (
+    SimpleObjectBatch, SimpleObjectList, SimpleObjectSync, SimpleResponse, simple_upload
+)
+from restlayer.throttling import LocalStore
+from restlayer.utils import get_uri_template
+from restlayer.warmup import warmup
+
 
 __all__ = ('SimpleTest', 'SimpleObjectTest')
 
@@ -81,6 +108,16 @@ class SimpleTest(BaseTestCase):
             b'<response><resource>foo</resource><resource>bar</resource></response>'
         )
 
+    def test_head(self):
+        r = self.client.head('/', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['content-type'], 'application/json; charset=UTF-8')
+        self.assertEqual(r['etag'], '"2"')
+        self.assertEqual(r.content, b'')
+
+        r = self.client.head('/', HTTP_ACCEPT='text/plain')
+        self.assertEqual(r.status_code, 406)
+
     def test_not_allowed(self):
         r = self.client.post('/', {'foo': 'bar'}, HTTP_ACCEPT='application/json')
         self.assertEqual(r.status_code, 405)
@@ -117,6 +154,79 @@ class SimpleTest(BaseTestCase):
         self.assertEqual(r.status_code, 200)
         self.assertEqual(json.loads(smart_text(r.content))['method'], 'PATCH')
 
+    def test_put_multipart(self):
+        upload = ContentFile(b'file content', name='test.txt')
+        r = self.client.put('/upload', encode_multipart(BOUNDARY, {'foo': 'bar', 'upload': upload}),
+                            HTTP_ACCEPT='application/json', content_type=MULTIPART_CONTENT)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content)), {
+            'foo': 'bar',
+            'files': {'upload': 'file content'},
+            'method': 'PUT'
+        })
+
+        # POST data already parsed before the resource is called
+        request = RequestFactory().post('/upload', {'foo': 'bar'}, HTTP_ACCEPT='application/json')
+        request.POST
+        r = simple_upload(request)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content))['foo'], 'bar')
+
+        # Upload handlers can't be set any more, files are still loaded
+        upload = ContentFile(b'file content', name='test.txt')
+        request = RequestFactory().put(
+            '/upload', encode_multipart(BOUNDARY, {'foo': 'bar', 'upload': upload}),
+            content_type=MULTIPART_CONTENT, HTTP_ACCEPT='application/json')
+        request.POST
+        r = simple_upload(request)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content))['files'], {'upload': 'file content'})
+
+        upload = ContentFile(b'x' * 2048, name='test.txt')
+        r = self.client.put('/upload', encode_multipart(BOUNDARY, {'upload': upload}),
+                            HTTP_ACCEPT='application/json', content_type=MULTIPART_CONTENT)
+        self.assertEqual(r.status_code, 413)
+
+    def test_input_schema(self):
+        r = self.client.post('/schema', {'foo': 'foo', 'bar': '3'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content)), {'foo': 'foo', 'bar': 3, 'kind': 'a'})
+
+        r = self.client.post(
+            '/schema', json.dumps({'foo': 'f' * 11, 'bar': 'x', 'kind': 'c'}),
+            HTTP_ACCEPT='application/json', content_type='application/json'
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(json.loads(smart_text(r.content)), {
+            'foo': ['Ensure this value has at most 10 characters (it has 11).'],
+            'bar': ['Enter a whole number.'],
+            'kind': ['Select a valid choice. c is not one of the available choices.'],
+        })
+
+        r = self.client.post(
+            '/schema', json.dumps([{'foo': 'foo', 'bar': 1}, {'foo': 'foo'}]),
+            HTTP_ACCEPT='application/json', content_type='application/json'
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(json.loads(smart_text(r.content)), {
+            '1': {'bar': ['This field is required.']}
+        })
+
+        self.assertRaises(ImproperlyConfigured, Response().validate_input, {})
+
+    def test_schema_numbers(self):
+        validate = compile_schema({'bar': Field(int), 'baz': Field(float, required=False)})
+        self.assertEqual(validate({'bar': '3', 'baz': '1.5'}), ({'bar': 3, 'baz': 1.5}, {}))
+        self.assertEqual(validate({'bar': 3.0})[0]['bar'], 3)
+
+        for value in (3.7, True, '3.7'):
+            self.assertEqual(validate({'bar': value})[1], {'bar': ['Enter a whole number.']})
+        for value in (False, 'nan', float('inf')):
+            self.assertEqual(validate({'bar': 1, 'baz': value})[1], {'baz': ['Enter a number.']})
+
+        # Length checks are for text only
+        self.assertRaises(ImproperlyConfigured, Field, int, max_length=3)
+
     def test_errors(self):
         r = self.client.get('/error', HTTP_ACCEPT='application/json')
         self.assertEqual(r['content-type'], 'text/plain')
@@ -128,6 +238,34 @@ class SimpleTest(BaseTestCase):
             self.assertTrue(smart_text(r.content).startswith('Exception at /error'))
             self.assertTrue(len(r.content) > 1000)
 
+    def test_errors_structured(self):
+        r = self.client.get('/error/structured', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(r['content-type'], 'application/json; charset=UTF-8')
+        self.assertEqual(json.loads(smart_text(r.content)),
+                         {'status': 500, 'message': 'An error occured.'})
+
+        with self.settings(DEBUG=True):
+            r = self.client.get('/error/structured', HTTP_ACCEPT='application/json')
+            self.assertEqual(r['content-type'], 'text/plain')
+            self.assertTrue(smart_text(r.content).startswith('Exception at /error'))
+
+    def test_error_log_sampling(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('django.request')
+        logger.addHandler(handler)
+        api._logged_errors.clear()
+        try:
+            for i in range(3):
+                r = self.client.get('/error', HTTP_ACCEPT='application/json')
+                self.assertEqual(r.status_code, 500)
+        finally:
+            logger.removeHandler(handler)
+
+        self.assertEqual(len(records), 1)
+
     def test_serializers(self):
         r = self.client.get('/serialize/text', HTTP_ACCEPT='application/json')
         self.assertEqual(r.status_code, 406)
@@ -140,8 +278,103 @@ class SimpleTest(BaseTestCase):
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.content, b'any')
 
+        # Serializers set on the instance
+        r = self.client.get('/serialize/instance', HTTP_ACCEPT='text/plain')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, b'instance')
+
+        r = self.client.get('/serialize/instance', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 406)
+
+    def test_uri_template(self):
+        self.assertEqual(get_uri_template('simple')(), '/')
+        self.assertEqual(get_uri_template('simple_object')(12), '/objects/12')
+        self.assertEqual(get_uri_template('simple_object')(12), '/objects/12')
+        self.assertTrue(get_uri_template('simple_object') is get_uri_template('simple_object'))
+        self.assertRaises(NoReverseMatch, get_uri_template('simple_object'), 1, 2)
+        self.assertRaises(NoReverseMatch, get_uri_template('ns:simple'))
+
+    def test_warmup(self):
+        errors, duration = warmup()
+        self.assertEqual(errors, {})
+        self.assertTrue(SimpleResponse in registry)
+        self.assertEqual(SimpleObjectList.check(), [])
+        self.assertTrue('*/*' in SimpleResponse.get_plan()['accept'])
+
+        stdout = StringIO()
+        call_command('restlayer_check', stdout=stdout)
+        self.assertTrue('response classes checked, no errors found' in stdout.getvalue())
+
+        class BrokenResponse(ModelResponse):
+            model = SimpleModel
+            fields = ('id', 'nope')
+            serializers = (('application/json', None),)
+        errors = BrokenResponse.check()
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith('serializers item'))
+        self.assertEqual(errors[1], 'Field nope not found.')
+
+        # The registry doesn't keep classes alive
+        self.assertTrue(BrokenResponse in registry)
+        del BrokenResponse
+        gc.collect()
+        self.assertFalse(any(x.__name__ == 'BrokenResponse' for x in registry))
+
+    def test_uri_template_build_absolute_uri(self):
+        class PrefixedResponse(Response):
+            def _build_absolute_uri(self, request, location=None):
+                return 'http://api.example.com/v1' + location
+
+        request = RequestFactory().get('/')
+        for resp in (Response(), PrefixedResponse()):
+            self.assertEqual(resp.uri_template(request, 'simple_object')(3),
+                             resp.reverse(request, 'simple_object', args=(3,)))
+
+    def test_throttle(self):
+        for i in range(2):
+            r = self.client.get('/throttled', HTTP_ACCEPT='application/json')
+            self.assertEqual(r.status_code, 200)
+
+        r = self.client.get('/throttled', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r['Retry-After'], '30')
+
+        # Buckets are per client
+        r = self.client.get('/throttled', HTTP_ACCEPT='application/json',
+                            REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(r.status_code, 200)
+
+    def test_throttle_local_store(self):
+        store = LocalStore(max_keys=2)
+        store.set('a', 1, 60)
+        store.set('b', 2, 60)
+        store.set('a', 3, 60)
+        store.set('c', 4, 60)
+
+        # Only the least recently used bucket is dropped
+        self.assertEqual(store.get('a'), 3)
+        self.assertEqual(store.get('b'), None)
+        self.assertEqual(store.get('c'), 4)
+
+        # Reading a bucket keeps it (throttled clients only read theirs)
+        self.assertEqual(store.get('a'), 3)
+        store.set('d', 5, 60)
+        self.assertEqual(store.get('a'), 3)
+        self.assertEqual(store.get('c'), None)
+
+    def test_max_concurrent(self):
+        r = self.client.get('/limited', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content)), 429)
+
+        # The slot is released once the request is done
+        r = self.client.get('/limited', HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(smart_text(r.content)), 429)
+
+
+class SimpleObjectTest(ResourceTestMixin, BaseTestCase):
+    multi_db = True
 
-class SimpleObjectTest(BaseTestCase):
     def create_object(self, **data):
         return self.client.post('/objects', data, HTTP_ACCEPT='application/json')
 
@@ -190,9 +423,14 @@ class SimpleObjectTest(BaseTestCase):
         self.assertEqual(r.status_code, 204)
 
     def test_404(self):
-        r = self.client.get('/objects/10', HTTP_ACCEPT='application/json')
-        self.assertEqual(r.status_code, 404)
-        self.assertEqual(json.loads(smart_text(r.content)), 'Resource not found')
+        for accept in ('application/json', 'application/json', 'application/xml'):
+            r = self.client.get('/objects/10', HTTP_ACCEPT=accept)
+            self.assertEqual(r.status_code, 404)
+            self.assertTrue(r['content-type'].startswith(accept))
+
+        self.assertEqual(json.loads(smart_text(
+            self.client.get('/objects/10', HTTP_ACCEPT='application/json').content
+        )), 'Resource not found')
 
     def test_pagination(self):
         for i in range(0, 32):
@@ -213,3 +451,275 @@ class SimpleObjectTest(BaseTestCase):
         self.assertTrue(r.has_header('x-pages-prev') and r.has_header('x-pages-prev-uri'))
 
         self.assertEqual(len(json.loads(smart_text(r.content))), 10)
+        for item in json.loads(smart_text(r.content)):
+            self.assertEqual(item['resource_uri'],
+                             'http://testserver/objects/{0}'.format(item['id']))
+
+        r = self.client.head('/objects?page=2', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['x-pages-current'], '2')
+        self.assertEqual(r['x-pages-objects'], '32')
+        self.assertEqual(r.content, b'')
+
+    def test_batch_fields(self):
+        for i in range(0, 12):
+            self.create_object(foo='foo-{0}'.format(i), bar=i)
+
+        del SimpleObjectBatch.batch_calls[:]
+        r = self.client.get('/objects/batch', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        data = json.loads(smart_text(r.content))
+        self.assertEqual(len(data), 10)
+        for i, item in enumerate(data):
+            self.assertEqual(item['double_bar'], i * 2)
+            self.assertEqual(item['upper_foo'], 'FOO-{0}'.format(i))
+        self.assertEqual(SimpleObjectBatch.batch_calls, [10])
+
+        # Threaded fields run with the request language in a pool kept per class
+        pool = get_field_pool(SimpleObjectBatch)
+        try:
+            r = self.client.get('/objects/batch?lang=fr', HTTP_ACCEPT='application/json')
+        finally:
+            translation.deactivate()
+        self.assertEqual(set(x['language'] for x in json.loads(smart_text(r.content))), set(['fr']))
+        self.assertTrue(get_field_pool(SimpleObjectBatch) is pool)
+
+        # Pools don't keep classes alive and are closed with them
+        class TemporaryBatch(ModelResponse):
+            pass
+        pool = get_field_pool(TemporaryBatch)
+        del TemporaryBatch
+        gc.collect()
+        self.assertFalse(any(x.__name__ == 'TemporaryBatch' for x in _field_pools))
+        self.assertNotEqual(pool._state, RUN)
+
+        r = self.client.get('/objects/batch/{0}'.format(data[3]['id']),
+                            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(smart_text(r.content))['double_bar'], 6)
+
+    def test_count_rows(self):
+        self.assertEqual(count_rows([1, 2]), 2)
+        self.assertEqual(count_rows({'objects': [1, 2, 3], 'deleted': [1]}), 3)
+        self.assertEqual(count_rows({'a': {'b': [1]}}), 1)
+        self.assertEqual(count_rows({'a': 1}), None)
+        self.assertEqual(count_rows('foo'), None)
+
+    def test_query_budget(self):
+        self.assertResourceQueries(1, '/objects', HTTP_ACCEPT='application/json')
+
+        for i in range(0, 12):
+            self.create_object(foo='foo-{0}'.format(i), bar=i)
+
+        self.assertResourceQueries(2, '/objects', HTTP_ACCEPT='application/json')
+        self.assertResourceQueries(2, '/objects?page=2', HTTP_ACCEPT='application/json')
+
+        self.assertRaises(BudgetExceeded, self.client.get, '/objects/greedy',
+                          HTTP_ACCEPT='application/json')
+
+        # Counting doesn't turn SQL logging on
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('django.db.backends')
+        level = logger.level
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        try:
+            self.client.get('/objects', HTTP_ACCEPT='application/json')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(records, [])
+
+        calls = []
+        records = []
+
+        def receiver(sender, **kwargs):
+            calls.append((kwargs['queries'], kwargs['rows']))
+
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('restlayer.budget')
+        logger.addHandler(handler)
+        budget_exceeded.connect(receiver)
+        try:
+            with self.settings(RESTLAYER_BUDGET_STRICT=False):
+                r = self.client.get('/objects/greedy', HTTP_ACCEPT='application/json')
+        finally:
+            budget_exceeded.disconnect(receiver)
+            logger.removeHandler(handler)
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(calls, [(12, 10)])
+        self.assertEqual(len(records), 1)
+
+    def test_sync(self):
+        locations = [self.create_object(foo='foo-{0}'.format(i), bar=i)['location']
+                     for i in range(3)]
+
+        # Row budgets apply to lists wrapped in dicts too
+        SimpleObjectSync.max_rows = 2
+        try:
+            self.assertRaises(BudgetExceeded, self.client.get, '/objects/sync',
+                              HTTP_ACCEPT='application/json')
+        finally:
+            SimpleObjectSync.max_rows = None
+
+        r = self.client.get('/objects/sync', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        data = json.loads(smart_text(r.content))
+        self.assertEqual(len(data['objects']), 3)
+        self.assertEqual(data['deleted'], [])
+        token = r['x-sync-token']
+
+        self.client.put(locations[0], 'foo=updated&bar=10', HTTP_ACCEPT='application/json',
+                        content_type='application/x-www-form-urlencoded')
+        self.client.delete(locations[1], HTTP_ACCEPT='application/json')
+        self.create_object(foo='new', bar=20)
+
+        r = self.client.get('/objects/sync', HTTP_ACCEPT='application/json',
+                            HTTP_X_SYNC_TOKEN=token)
+        data = json.loads(smart_text(r.content))
+        self.assertEqual(sorted(x['foo'] for x in data['objects']), ['new', 'updated'])
+        self.assertEqual(data['deleted'], [int(locations[1].rsplit('/', 1)[1])])
+
+        r = self.client.get('/objects/sync?since={0}'.format(r['x-sync-token']),
+                            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(smart_text(r.content)), {'objects': [], 'deleted': []})
+
+        r = self.client.get('/objects/sync?since=foo', HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 400)
+
+    def test_sync_filtered(self):
+        locations = [self.create_object(foo='foo-{0}'.format(i), bar=i)['location']
+                     for i in range(3)]
+
+        r = self.client.get('/objects/sync?bar_lt=5', HTTP_ACCEPT='application/json')
+        token = r['x-sync-token']
+
+        self.client.put(locations[0], 'foo=foo-0&bar=100', HTTP_ACCEPT='application/json',
+                        content_type='application/x-www-form-urlencoded')
+        self.client.put(locations[1], 'foo=updated&bar=1', HTTP_ACCEPT='application/json',
+                        content_type='application/x-www-form-urlencoded')
+        self.create_object(foo='other', bar=200)
+
+        # Objects out of the queryset are not reported by default
+        r = self.client.get('/objects/sync?bar_lt=5&since={0}'.format(token),
+                            HTTP_ACCEPT='application/json')
+        data = json.loads(smart_text(r.content))
+        self.assertEqual([x['foo'] for x in data['objects']], ['updated'])
+        self.assertEqual(data['deleted'], [])
+
+        # On demand, they get a tombstone (even the ones that never matched)
+        r = self.client.get('/objects/sync?bar_lt=5&public&since={0}'.format(token),
+                            HTTP_ACCEPT='application/json')
+        data = json.loads(smart_text(r.content))
+        self.assertEqual([x['foo'] for x in data['objects']], ['updated'])
+        self.assertEqual(len(data['deleted']), 2)
+        self.assertTrue(int(locations[0].rsplit('/', 1)[1]) in data['deleted'])
+
+    def test_sync_paged(self):
+        locations = [self.create_object(foo='foo-{0}'.format(i), bar=i)['location']
+                     for i in range(3)]
+
+        r = self.client.get('/objects/sync?paged', HTTP_ACCEPT='application/json')
+        self.assertEqual(r['x-pages-count'], '2')
+        self.assertEqual(len(json.loads(smart_text(r.content))['objects']), 2)
+        token = r['x-sync-token']
+
+        # Later pages keep the token of the first one, objects created
+        # meanwhile come again with the next sync
+        self.create_object(foo='new', bar=3)
+        r = self.client.get(r['x-pages-next-uri'], HTTP_ACCEPT='application/json')
+        self.assertEqual(r['x-sync-token'], token)
+        self.assertEqual([x['foo'] for x in json.loads(smart_text(r.content))['objects']],
+                         ['foo-2', 'new'])
+
+        self.client.delete(locations[0], HTTP_ACCEPT='application/json')
+        for i in (1, 2):
+            self.client.put(locations[i], 'foo=updated-{0}&bar={0}'.format(i),
+                            HTTP_ACCEPT='application/json',
+                            content_type='application/x-www-form-urlencoded')
+
+        r = self.client.get('/objects/sync?paged&since={0}'.format(token),
+                            HTTP_ACCEPT='application/json')
+        self.assertEqual(r['x-pages-count'], '2')
+        data = json.loads(smart_text(r.content))
+        self.assertEqual(len(data['objects']), 2)
+        self.assertEqual(data['deleted'], [int(locations[0].rsplit('/', 1)[1])])
+        first = data['objects']
+        token = r['x-sync-token']
+
+        r = self.client.get(r['x-pages-next-uri'], HTTP_ACCEPT='application/json')
+        self.assertEqual(r['x-sync-token'], token)
+        data = json.loads(smart_text(r.content))
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(sorted(x['foo'] for x in first + data['objects']),
+                         ['new', 'updated-1', 'updated-2'])
+
+    def test_sync_prune(self):
+        self.create_object(foo='foo', bar=1)
+        r = self.client.get('/objects/sync', HTTP_ACCEPT='application/json')
+        old_token = r['x-sync-token']
+
+        self.create_object(foo='foo', bar=2)
+        self.create_object(foo='foo', bar=3)
+        r = self.client.get('/objects/sync', HTTP_ACCEPT='application/json')
+        token = r['x-sync-token']
+
+        prune(timezone.now() + timedelta(days=1))
+
+        r = self.client.get('/objects/sync?since={0}'.format(old_token),
+                            HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 410)
+
+        r = self.client.get('/objects/sync?since={0}'.format(token),
+                            HTTP_ACCEPT='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(smart_text(r.content)), {'objects': [], 'deleted': []})
+
+    def get_replica_queries(self, path, method='get', **extra):
+        with QueryCounter('default') as default:
+            with QueryCounter('replica') as replica:
+                r = getattr(self.client, method)(path, HTTP_ACCEPT='application/json', **extra)
+        return r, default.count, replica.count
+
+    def test_read_replica(self):
+        # Both test databases are distinct, their rows tell where reads went
+        SimpleModel.objects.using('replica').create(foo='replica', bar=0)
+        r = self.create_object(foo='primary', bar=1)
+        self.assertTrue('restlayer_primary' in r.cookies)
+        del self.client.cookies['restlayer_primary']
+
+        # Reads, pagination count included, go to the replica
+        r, default, replica = self.get_replica_queries('/objects/replica')
+        self.assertEqual((default, replica), (0, 2))
+        self.assertEqual([x['foo'] for x in json.loads(smart_text(r.content))], ['replica'])
+
+        # Writes never go to the replica and pin the client to the primary
+        r, default, replica = self.get_replica_queries('/objects/replica', 'post',
+                                                       data={'foo': 'bar'})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(replica, 0)
+        self.assertTrue('restlayer_primary' in r.cookies)
+
+        r, default, replica = self.get_replica_queries('/objects/replica')
+        self.assertEqual((default, replica), (2, 0))
+        self.assertEqual([x['foo'] for x in json.loads(smart_text(r.content))],
+                         ['primary', 'bar'])
+
+        self.client.cookies['restlayer_primary'] = '0'
+        r, default, replica = self.get_replica_queries('/objects/replica')
+        self.assertEqual((default, replica), (0, 2))
+        self.assertEqual([x['foo'] for x in json.loads(smart_text(r.content))], ['replica'])
+
+        # Writes on classes without read_using pin the client when the router is in use
+        r = self.create_object(foo='foo', bar=2)
+        self.assertTrue('restlayer_primary' in r.cookies)
+
+        r, default, replica = self.get_replica_queries('/objects/replica')
+        self.assertEqual((default, replica), (2, 0))
+
+        with self.settings(DATABASE_ROUTERS=[]):
+            r = self.create_object(foo='foo', bar=3)
+            self.assertFalse('restlayer_primary' in r.cookies)
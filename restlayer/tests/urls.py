@@ -13,10 +13,21 @@ urlpatterns = patterns(
     url(r'^$', 'simple', name='simple'),
     url(r'^post$', 'simple_post', name='simple_post'),
     url(r'^echo$', 'simple_echo', name='simple_echo'),
+    url(r'^upload$', 'simple_upload'),
+    url(r'^schema$', 'simple_schema'),
     url(r'^error$', 'simple_error'),
+    url(r'^error/structured$', 'simple_error_structured'),
     url(r'^serialize/text$', 'simple_s_text'),
     url(r'^serialize/any$', 'simple_s_any'),
+    url(r'^serialize/instance$', 'simple_s_instance'),
+    url(r'^throttled$', 'simple_throttled'),
+    url(r'^limited$', 'simple_limited'),
 
     url(r'^objects$', 'simple_object_list', name='simple_objects'),
     url(r'^objects/(\d+)$', 'simple_object', name='simple_object'),
+    url(r'^objects/batch$', 'simple_object_batch'),
+    url(r'^objects/greedy$', 'simple_object_greedy'),
+    url(r'^objects/sync$', 'simple_object_sync'),
+    url(r'^objects/replica$', 'simple_object_replica'),
+    url(r'^objects/batch/(?P<pk>\d+)$', 'simple_object_batch'),
 )
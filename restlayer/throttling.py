@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import threading
+import time
+
+
+class LocalStore(object):
+    """
+    In-process bucket store. Each worker process has its own buckets. When
+    more than ``max_keys`` buckets are stored, the least recently used ones
+    are dropped. ``lock`` makes bucket updates atomic within the process.
+    """
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.lock = threading.RLock()
+        self._data = {}
+        # Circular doubly linked list of [prev, next, key] links, most
+        # recently used last.
+        self._root = root = []
+        root[:] = [root, root, None]
+
+    def _unlink(self, link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+    def _append(self, link):
+        root = self._root
+        link[0] = root[0]
+        link[1] = root
+        root[0][1] = link
+        root[0] = link
+
+    def get(self, key):
+        with self.lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] < time.time():
+                self._unlink(item[2])
+                del self._data[key]
+                return None
+
+            self._unlink(item[2])
+            self._append(item[2])
+            return item[0]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            item = self._data.get(key)
+            if item is None:
+                while len(self._data) >= self.max_keys:
+                    oldest = self._root[1]
+                    self._unlink(oldest)
+                    del self._data[oldest[2]]
+                link = [None, None, key]
+            else:
+                link = item[2]
+                self._unlink(link)
+
+            self._append(link)
+            self._data[key] = (value, time.time() + timeout, link)
+
+
+class CacheStore(object):
+    """
+    Bucket store backed by a Django cache, shared by all the processes using
+    this cache. Buckets are read and written without any lock: under heavy
+    contention, concurrent requests of one client may read the same bucket
+    and a few extra requests get through.
+    """
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from django.core.cache import get_cache
+            self._cache = get_cache(self.alias)
+        return self._cache
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+
+class Throttle(object):
+    """
+    Token bucket allowing ``rate`` requests every ``per`` seconds, with bursts
+    up to ``burst`` requests.
+    """
+    def __init__(self, rate, per=1, burst=None, store=None):
+        self.rate = rate / per
+        self.burst = burst or rate
+        self.store = store or LocalStore()
+
+    def get_client_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated():
+            return 'user:{0}'.format(user.pk)
+        return 'ip:{0}'.format(request.META.get('REMOTE_ADDR', ''))
+
+    def consume(self, key):
+        """
+        Takes a token from the bucket. Returns 0 when the request is allowed,
+        the number of seconds to wait before the next token otherwise.
+        """
+        lock = getattr(self.store, 'lock', None)
+        if lock is None:
+            return self._consume(key)
+        with lock:
+            return self._consume(key)
+
+    def _consume(self, key):
+        timeout = int(self.burst / self.rate) + 1
+
+        now = time.time()
+        bucket = self.store.get(key)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+
+        self.store.set(key, (tokens - 1, now), timeout)
+        return 0
+
+
+class ConcurrencyLimit(object):
+    """
+    Caps the number of requests being processed at the same time in the
+    current process.
+    """
+    def __init__(self, max_requests):
+        self.max_requests = max_requests
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= self.max_requests:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
@@ -4,40 +4,96 @@
 # See the LICENSE for more information.
 from __future__ import (print_function, division, absolute_import, unicode_literals)
 
-from django.utils.six import StringIO
-from django.utils.encoding import smart_text
+from django.core.urlresolvers import get_resolver, get_script_prefix, get_urlconf, reverse
+from django.http import QueryDict
+from django.http.multipartparser import MultiPartParser
+from django.utils.datastructures import MultiValueDict
+from django.utils.encoding import force_text, iri_to_uri, smart_text
+from django.utils.http import urlquote
+from django.utils.six import StringIO, string_types
+from django.utils.translation import get_language
 
 from django.utils.xmlutils import SimplerXMLGenerator
 
 
 CONTENT_VERBS = ('POST', 'PUT', 'PATCH')
+SAFE_VERBS = ('GET', 'HEAD', 'OPTIONS')
 
 
 def get_request_data(request):
     """
-    Django doesn't particularly understand REST.
-    In case we send data over PUT, Django won't
-    actually look at the data and load it. We need
-    to twist its arm here.
+    Django only loads form data of POST requests. Data sent over PUT or
+    PATCH is parsed here without touching the request method, using the
+    request upload handlers, so files are streamed to disk when needed.
 
-    The try/except abominiation here is due to a bug
-    in mod_python. This should fix it.
+    Uploaded files are available in ``request.data_files`` whatever the
+    method is (``request.FILES`` is only filled for POST requests).
     """
+    if request.method == 'POST':
+        request.data_files = request.FILES
+        return request.POST
+
     if request.method in CONTENT_VERBS:
-        if request.method == 'POST':
-            return request.POST
+        content_type = request.META.get('CONTENT_TYPE', '')
+        if content_type.startswith('multipart/form-data'):
+            parser = MultiPartParser(request.META, request, request.upload_handlers,
+                                     request.encoding)
+            data, files = parser.parse()
+        elif content_type.startswith('application/x-www-form-urlencoded'):
+            data, files = QueryDict(request.body, encoding=request.encoding), MultiValueDict()
         else:
-            orig_meth = request.method
-            try:
-                request.method = 'POST'
-                request._load_post_and_files()
-                request.method = orig_meth
-            except AttributeError:
-                request.META['REQUEST_METHOD'] = 'POST'
-                request._load_post_and_files()
-                request.META['REQUEST_METHOD'] = orig_meth
-
-            return request.POST
+            data, files = QueryDict('', encoding=request.encoding), MultiValueDict()
+
+        request.data_files = files
+        return data
+
+
+class URITemplate(object):
+    """
+    Builds URLs of a view by formatting a template instead of running the URL
+    resolver for each call. Arguments are not checked against the URL pattern.
+    Views that can't be turned into a template (namespaced names, ambiguous
+    patterns) fall back to ``reverse``.
+    """
+    def __init__(self, view, template=None, params=None):
+        self.view = view
+        self.template = template
+        self.params = params
+
+    def __call__(self, *args, **kwargs):
+        if self.template is None:
+            return reverse(self.view, args=args, kwargs=kwargs)
+
+        if args:
+            if len(args) != len(self.params):
+                return reverse(self.view, args=args)
+            kwargs = dict(zip(self.params, args))
+        try:
+            return self.template % dict((k, urlquote(force_text(v))) for k, v in kwargs.items())
+        except KeyError:
+            return reverse(self.view, kwargs=kwargs)
+
+
+def get_uri_template(view):
+    """
+    Returns a URITemplate for ``view``. Templates are cached on the URL
+    resolver, so they go away when URL caches are cleared.
+    """
+    resolver = get_resolver(get_urlconf())
+    cache = resolver.__dict__.setdefault('_restlayer_uri_templates', {})
+    key = (view, get_language(), get_script_prefix())
+
+    if key not in cache:
+        template = URITemplate(view)
+        if not isinstance(view, string_types) or ':' not in view:
+            possibilities = resolver.reverse_dict.getlist(view)
+            if len(possibilities) == 1 and len(possibilities[0][0]) == 1:
+                result, params = possibilities[0][0][0]
+                prefix = iri_to_uri(urlquote(get_script_prefix())).replace('%', '%%')
+                template = URITemplate(view, prefix + iri_to_uri(result), params)
+        cache[key] = template
+
+    return cache[key]
 
 
 def xml_dumps(data):
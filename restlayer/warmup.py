@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django restlayer released under the MIT license.
+# See the LICENSE for more information.
+from __future__ import (print_function, division, absolute_import, unicode_literals)
+
+import time
+
+from django.core.urlresolvers import get_resolver, get_urlconf
+
+from restlayer.api import registry
+
+
+def load_views(resolver):
+    """
+    Imports every view of a URL resolver, defining the Response classes of
+    the views declared as strings.
+    """
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, 'url_patterns'):
+            load_views(pattern)
+        else:
+            pattern.callback
+
+
+def warmup(urlconf=None):
+    """
+    Loads the views of ``urlconf`` (the current one by default), checks every
+    Response class and builds their plans. Call it from your WSGI script to
+    have workers ready before the first request.
+
+    Returns a tuple of a dict of classes and configuration errors, and the
+    time it took in seconds.
+    """
+    start = time.time()
+
+    resolver = get_resolver(urlconf or get_urlconf())
+    load_views(resolver)
+    resolver.reverse_dict
+
+    errors = {}
+    for resp_class in list(registry):
+        class_errors = resp_class.check()
+        if class_errors:
+            errors[resp_class] = class_errors
+        else:
+            resp_class.warmup()
+
+    return errors, time.time() - start
@@ -26,7 +26,7 @@ setup(
         'django >= 1.5.5, < 1.7',
         'python-mimeparse >= 0.1.4',
     ],
-    packages=['restlayer'],
+    packages=['restlayer', 'restlayer.management', 'restlayer.management.commands'],
     test_suite='tests.runtests',
     classifiers=[
         'Development Status :: 5 - Production/Stable',
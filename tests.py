@@ -31,7 +31,11 @@ def setup_test_environment():
             'default': {
                 'ENGINE': 'django.db.backends.sqlite3',
             },
+            'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+            },
         },
+        'DATABASE_ROUTERS': ['restlayer.db.ReadReplicaRouter'],
         'INSTALLED_APPS': APPS,
         'MIDDLEWARE_CLASSES': (
             'django.middleware.common.CommonMiddleware',
@@ -39,6 +43,7 @@ def setup_test_environment():
             'django.middleware.clickjacking.XFrameOptionsMiddleware',
         ),
         'ROOT_URLCONF': '',
+        'RESTLAYER_BUDGET_STRICT': True,
     }
 
     settings.configure(**settings_dict)